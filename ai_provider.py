@@ -0,0 +1,185 @@
+"""
+Configurable client for the OpenAI-compatible chat completions API used by /chat.
+
+Configuration comes from environment variables:
+    AI_API_URL   Chat completions endpoint (default: OpenRouter).
+    AI_MODEL     Model name.
+    AI_API_KEY   Bearer token. When unset no Authorization header is sent (e.g. for the local mock).
+    AI_TIMEOUT   Request timeout in seconds (default 60).
+    AI_MODE      'live' (default), 'record' or 'replay'.
+    AI_CASSETTE  JSON Lines file used by the record and replay modes (default ai_cassette.jsonl).
+
+In record mode every live request/response pair is appended to the cassette. In replay mode no
+network calls are made: responses are looked up in the cassette by request payload, so a recorded
+session can be re-run deterministically on an offline machine. See mock_ai_server.py for a local
+server to point AI_API_URL at.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import requests
+
+DEFAULT_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "nvidia/llama-3.1-nemotron-nano-8b-v1:free"
+
+MODES = ("live", "record", "replay")
+
+class Cassette:
+    """
+    A JSON Lines file of recorded request/response pairs.
+
+    Requests are matched on a hash of their canonical JSON payload. When the same request was
+    recorded several times, replay returns the recorded responses in order and then starts over,
+    so repeated runs always see the same sequence.
+    """
+    def __init__(self, path):
+        """
+        Parameters:
+            path (str): The cassette file. It is created on the first recording.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._positions = {}
+
+    @staticmethod
+    def key(payload):
+        """
+        Returns the lookup key for a request payload.
+        """
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def record(self, payload, status, body):
+        """
+        Appends a request and the raw response status and body to the cassette.
+        """
+        line = json.dumps({'key': self.key(payload), 'request': payload, 'status': status, 'response': body})
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+            self._entries = None
+
+    def replay(self, payload):
+        """
+        Returns the next recorded (status, body) for a request payload.
+
+        Raises:
+            Exception: If the request was never recorded.
+        """
+        key = self.key(payload)
+        with self._lock:
+            if self._entries is None:
+                self._entries = {}
+                if os.path.exists(self.path):
+                    with open(self.path, encoding='utf-8') as f:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                self._entries.setdefault(entry['key'], []).append(entry)
+            entries = self._entries.get(key)
+            if not entries:
+                raise Exception(f"No recorded response in {self.path} for request {key[:12]}")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            entry = entries[position % len(entries)]
+        return entry['status'], entry['response']
+
+class AIProvider:
+    """
+    Sends chat completion requests to the configured provider, or replays them from a cassette.
+    """
+    def __init__(self, url=DEFAULT_URL, model=DEFAULT_MODEL, api_key=None, timeout=60,
+                 mode="live", cassette=None):
+        """
+        Parameters:
+            url (str): The chat completions endpoint.
+            model (str): The model name sent with every request.
+            api_key (str): (Optional) The bearer token; no Authorization header is sent without one.
+            timeout (float): The request timeout in seconds.
+            mode (str): 'live', 'record' or 'replay'.
+            cassette (Cassette): The cassette used by the record and replay modes.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown AI mode: {mode}")
+        if mode != "live" and cassette is None:
+            raise ValueError(f"AI mode '{mode}' needs a cassette")
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.mode = mode
+        self.cassette = cassette
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """
+        The calling thread's requests.Session.
+
+        Connections to the provider are reused across requests, but each thread gets its own
+        session: requests.Session is not documented as thread-safe, and Flask serves requests
+        from several threads.
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a provider from the AI_* environment variables described in the module docstring.
+        """
+        mode = os.environ.get('AI_MODE', 'live')
+        return cls(
+            url=os.environ.get('AI_API_URL', DEFAULT_URL),
+            model=os.environ.get('AI_MODEL', DEFAULT_MODEL),
+            api_key=os.environ.get('AI_API_KEY'),
+            timeout=float(os.environ.get('AI_TIMEOUT', 60)),
+            mode=mode,
+            cassette=Cassette(os.environ.get('AI_CASSETTE', 'ai_cassette.jsonl')) if mode != 'live' else None
+        )
+
+    def _headers(self):
+        """
+        Returns the request headers, including the bearer token when one is configured.
+        """
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def complete(self, messages):
+        """
+        Requests a completion for the given conversation.
+
+        Parameters:
+            messages (list): The conversation as dictionaries with "role" and "content" keys.
+
+        Returns:
+            str: The content of the first choice's message.
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages
+        }
+
+        if self.mode == "replay":
+            status, body = self.cassette.replay(payload)
+        else:
+            response = self.session.post(self.url, headers=self._headers(), data=json.dumps(payload), timeout=self.timeout)
+            status, body = response.status_code, response.text
+            if self.mode == "record":
+                self.cassette.record(payload, status, body)
+
+        if status != 200:
+            raise Exception(f"Request failed with status {status}: {body}")
+
+        response_json = json.loads(body)
+
+        try:
+            return response_json["choices"][0]["message"]["content"]
+        except (KeyError, IndexError):
+            raise Exception("Unexpected response structure: " + json.dumps(response_json, indent=2))
@@ -0,0 +1,451 @@
+"""
+Background batch jobs that run across all users, outside of the request cycle.
+
+Each job walks a list of integer keys (user ids by default) in chunks. After every chunk the
+job's writes are committed and its checkpoint advanced, so a job that crashes part way through
+resumes from the last finished chunk instead of starting over. When the per-user tables live in
+database.db the writes and checkpoint share one transaction; with sharded storage (see storage.py)
+a crash can replay the last chunk, which is harmless because every job's writes are idempotent.
+
+Usage (e.g. from a nightly cron entry):
+    python jobs.py nightly
+    python jobs.py run regenerate_wellness_plans --workers 4
+    python jobs.py list
+    python jobs.py status 12
+    python jobs.py resume 12
+"""
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from project import init_db, mood_tracker
+from storage import DIRECTORY_DB, USER_DATA_TABLES, group_by_path, user_db_paths
+
+logger = logging.getLogger(__name__)
+
+# Registered jobs, keyed by name, in the order they run during the nightly batch.
+JOBS = {}
+
+# Statuses a job run can be in. Anything other than 'completed' can be resumed.
+INCOMPLETE_STATUSES = ("pending", "running", "failed")
+
+# Seconds without a heartbeat after which a 'running' job is considered abandoned and may be taken
+# over by another process. The heartbeat is renewed after every chunk, so a single chunk must
+# finish well within this time.
+LEASE_SECONDS = 600
+
+def register_job(name, keys=None, cpu_bound=False):
+    """
+    Decorator that registers a job step under the given name.
+
+    The step is called as step(conn, ids, pool) for every chunk of keys, where conn is connected to
+    the directory database. It should only read from the databases and return a list of
+    (path, sql, params) write statements; the runner applies them together with the checkpoint so
+    writes stay short and are rate limited.
+
+    Parameters:
+        name (str): The name used to run the job from the CLI.
+        keys (callable): (Optional) keys(conn, after, limit) returning the next ids greater than
+                         'after' in ascending order. Defaults to iterating over all user ids.
+        cpu_bound (bool): (Optional) Whether the step needs a process pool for CPU-bound work.
+    """
+    def decorator(step):
+        JOBS[name] = {'step': step, 'keys': keys or _user_ids, 'cpu_bound': cpu_bound}
+        return step
+    return decorator
+
+class WriteThrottle:
+    """
+    Paces database writes so a running job cannot monopolise SQLite's writer lock.
+    """
+    def __init__(self, writes_per_second):
+        """
+        Parameters:
+            writes_per_second (float): The maximum sustained write rate. 0 or None disables throttling.
+        """
+        self.interval = 1.0 / writes_per_second if writes_per_second else 0
+        self._next_write = time.monotonic()
+
+    def wait(self, writes=1):
+        """
+        Blocks until the given number of writes may be issued without exceeding the rate.
+        """
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next_write > now:
+            time.sleep(self._next_write - now)
+            now = self._next_write
+        self._next_write = now + writes * self.interval
+
+def __get_db_connection():
+    """
+    Returns a new connection to the SQLite database with the row_factory set to access columns by name.
+    """
+    conn = sqlite3.connect(DIRECTORY_DB)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _user_ids(conn, after, limit):
+    """
+    Returns the next chunk of user ids greater than 'after'.
+    """
+    rows = conn.execute('SELECT id FROM users WHERE id > ? ORDER BY id ASC LIMIT ?', (after, limit)).fetchall()
+    return [row[0] for row in rows]
+
+def _orphaned_user_ids(conn, after, limit):
+    """
+    Returns the next chunk of user ids that still own rows but no longer have an account.
+    """
+    union = " UNION ".join(f"SELECT user_id FROM {table}" for table in USER_DATA_TABLES)
+    while True:
+        candidates = set()
+        for path in user_db_paths():
+            with sqlite3.connect(path) as shard:
+                rows = shard.execute(
+                    f"SELECT user_id FROM ({union}) WHERE user_id > ? ORDER BY user_id ASC LIMIT ?",
+                    (after, limit)
+                ).fetchall()
+            candidates.update(row[0] for row in rows)
+        candidates = sorted(candidates)[:limit]
+        if not candidates:
+            return []
+        existing = {row[0] for row in conn.execute(
+            f"SELECT id FROM users WHERE id IN ({_placeholders(candidates)})", candidates
+        )}
+        orphaned = [user_id for user_id in candidates if user_id not in existing]
+        if orphaned:
+            return orphaned
+        # Every candidate still has an account; keep scanning past them.
+        after = candidates[-1]
+
+def _single_pass(conn, after, limit):
+    """
+    Yields a single key so that a job which is not per-user runs exactly once.
+    """
+    return [1] if after < 1 else []
+
+def _placeholders(ids):
+    return ", ".join("?" for _ in ids)
+
+def _build_wellness_plan(task):
+    """
+    Process pool worker: builds the wellness plan for one (user_id, history) pair.
+    """
+    user_id, history = task
+    return user_id, mood_tracker.generate_wellness_plan(user_id, history)
+
+@register_job('purge_orphaned_rows', keys=_orphaned_user_ids)
+def purge_orphaned_rows(conn, user_ids, pool):
+    """
+    Removes rows left behind by deleted accounts.
+    """
+    return [(path, f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            for path, path_user_ids in group_by_path(user_ids).items()
+            for user_id in path_user_ids for table in USER_DATA_TABLES]
+
+@register_job('compute_mood_aggregates')
+def compute_mood_aggregates(conn, user_ids, pool):
+    """
+    Recomputes each user's per-mood entry count and average intensity.
+    """
+    writes = []
+    for path, path_user_ids in group_by_path(user_ids).items():
+        with sqlite3.connect(path) as shard:
+            rows = shard.execute(
+                f'''SELECT user_id, mood_id, COUNT(*) AS entries, AVG(intensity) AS average_intensity,
+                           MAX(created_at) AS last_entry_at
+                    FROM moods WHERE user_id IN ({_placeholders(path_user_ids)})
+                    GROUP BY user_id, mood_id''',
+                path_user_ids
+            ).fetchall()
+        writes.extend((path, "DELETE FROM mood_aggregates WHERE user_id = ?", (user_id,)) for user_id in path_user_ids)
+        for user_id, mood_id, entries, average_intensity, last_entry_at in rows:
+            writes.append((
+                path,
+                '''INSERT INTO mood_aggregates (user_id, mood_id, entries, average_intensity, last_entry_at)
+                   VALUES (?, ?, ?, ?, ?)''',
+                (user_id, mood_id, entries, average_intensity, last_entry_at)
+            ))
+    return writes
+
+@register_job('regenerate_wellness_plans', cpu_bound=True)
+def regenerate_wellness_plans(conn, user_ids, pool):
+    """
+    Replaces each user's stored wellness plan with one built from their current mood history.
+    """
+    histories = {}
+    paths = group_by_path(user_ids)
+    for path, path_user_ids in paths.items():
+        with sqlite3.connect(path) as shard:
+            shard.row_factory = sqlite3.Row
+            rows = shard.execute(
+                f'''SELECT user_id, mood_types.name AS mood, intensity, description, created_at
+                    FROM moods JOIN mood_types ON mood_types.id = moods.mood_id
+                    WHERE user_id IN ({_placeholders(path_user_ids)})
+                    ORDER BY created_at ASC''',
+                path_user_ids
+            ).fetchall()
+        for row in rows:
+            entry = dict(row)
+            histories.setdefault(entry.pop('user_id'), []).append(entry)
+
+    path_of = {user_id: path for path, path_user_ids in paths.items() for user_id in path_user_ids}
+    # Users without any mood entries (e.g. after clearing their history) must not keep an old plan.
+    writes = [(path_of[user_id], "DELETE FROM wellness_plans WHERE user_id = ?", (user_id,))
+              for user_id in user_ids if user_id not in histories]
+    for user_id, plan in pool.map(_build_wellness_plan, histories.items()):
+        writes.append((path_of[user_id], "DELETE FROM wellness_plans WHERE user_id = ?", (user_id,)))
+        writes.append((path_of[user_id], "INSERT INTO wellness_plans (user_id, plan_text) VALUES (?, ?)",
+                       (user_id, plan)))
+    return writes
+
+@register_job('reindex', keys=_single_pass)
+def reindex(conn, keys, pool):
+    """
+    Rebuilds indexes and refreshes the query planner statistics in every database file.
+    """
+    paths = dict.fromkeys([DIRECTORY_DB, *user_db_paths()])
+    return [(path, sql, ()) for path in paths for sql in ("REINDEX", "ANALYZE")]
+
+def _apply_writes(conn, writes):
+    """
+    Executes a chunk's (path, sql, params) writes. Shard writes are committed per file; writes to
+    the directory database are left in conn's open transaction for the caller to commit.
+    """
+    by_path = {}
+    for path, sql, params in writes:
+        by_path.setdefault(path, []).append((sql, params))
+    for path, statements in by_path.items():
+        if path == DIRECTORY_DB:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            continue
+        shard = sqlite3.connect(path)
+        try:
+            with shard:
+                for sql, params in statements:
+                    shard.execute(sql, params)
+        finally:
+            shard.close()
+
+def create_job(name):
+    """
+    Records a new pending run of the named job.
+
+    Returns:
+        int: The ID of the new job run.
+    """
+    if name not in JOBS:
+        raise ValueError(f"Unknown job: {name}")
+    with sqlite3.connect(DIRECTORY_DB) as conn:
+        cursor = conn.execute("INSERT INTO jobs (name) VALUES (?)", (name,))
+        conn.commit()
+        return cursor.lastrowid
+
+def get_job(job_id):
+    """
+    Returns the job run with the given ID as a dictionary, or None if it does not exist.
+    """
+    conn = __get_db_connection()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def list_jobs(limit=20):
+    """
+    Returns the most recent job runs, newest first.
+    """
+    conn = __get_db_connection()
+    rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def _claim_job(conn, job_id, owner):
+    """
+    Marks a job run as running under owner, unless it is completed or another process holds an
+    unexpired lease on it.
+
+    Returns:
+        bool: Whether the job was claimed.
+    """
+    now = time.time()
+    cursor = conn.execute(
+        '''UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, error = NULL,
+                            updated_at = CURRENT_TIMESTAMP
+           WHERE id = ? AND status != 'completed'
+             AND (status != 'running' OR heartbeat IS NULL OR heartbeat < ?)''',
+        (owner, now, job_id, now - LEASE_SECONDS)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+def run_job(job_id, chunk_size=100, writes_per_second=200, workers=None):
+    """
+    Runs (or resumes) a job from its last checkpoint until every key has been processed.
+
+    The run is claimed with a lease first, so two processes (e.g. overlapping cron runs) never
+    work on the same job at once.
+
+    Parameters:
+        job_id (int): The ID of the job run, as returned by create_job.
+        chunk_size (int): The number of keys handled per chunk/commit.
+        writes_per_second (float): The write rate limit; 0 disables throttling.
+        workers (int): (Optional) Process pool size for CPU-bound jobs. Defaults to the CPU count.
+
+    Returns:
+        dict: The job run after it finished, or None if another process is running it.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise ValueError(f"No job with id {job_id}")
+    if job['status'] == 'completed':
+        return job
+    definition = JOBS[job['name']]
+
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    conn = __get_db_connection()
+    if not _claim_job(conn, job_id, owner):
+        conn.close()
+        return None
+    # Re-read the checkpoint now that the run is ours; a previous owner may have advanced it.
+    checkpoint = conn.execute("SELECT checkpoint FROM jobs WHERE id = ?", (job_id,)).fetchone()['checkpoint']
+    throttle = WriteThrottle(writes_per_second)
+    pool = ProcessPoolExecutor(max_workers=workers) if definition['cpu_bound'] else None
+    try:
+        while True:
+            ids = definition['keys'](conn, checkpoint, chunk_size)
+            if not ids:
+                break
+            writes = definition['step'](conn, ids, pool)
+            throttle.wait(len(writes))
+            _apply_writes(conn, writes)
+            checkpoint = ids[-1]
+            cursor = conn.execute(
+                '''UPDATE jobs SET checkpoint = ?, processed = processed + ?, heartbeat = ?,
+                                    updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND owner = ?''',
+                (checkpoint, len(ids), time.time(), job_id, owner)
+            )
+            if cursor.rowcount != 1:
+                raise RuntimeError(f"Lost the lease on job {job_id} to another process")
+            conn.commit()
+        conn.execute("UPDATE jobs SET status = 'completed', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND owner = ?",
+                     (job_id, owner))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        conn.execute(
+            '''UPDATE jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+               WHERE id = ? AND owner = ?''',
+            (str(e), job_id, owner)
+        )
+        conn.commit()
+        raise
+    finally:
+        conn.close()
+        if pool is not None:
+            pool.shutdown()
+    return get_job(job_id)
+
+def run_nightly(**options):
+    """
+    Runs every registered job once, resuming an unfinished run of a job instead of starting a new one.
+    Jobs that another process is currently running are skipped. A job that fails is logged and left
+    marked 'failed' so the next nightly run resumes it; the remaining jobs still run.
+
+    Returns:
+        list: The job runs that were attempted, including failed ones.
+    """
+    conn = __get_db_connection()
+    finished = []
+    for name in JOBS:
+        row = conn.execute(
+            f"SELECT id FROM jobs WHERE name = ? AND status IN ({_placeholders(INCOMPLETE_STATUSES)}) ORDER BY id DESC",
+            (name, *INCOMPLETE_STATUSES)
+        ).fetchone()
+        job_id = row['id'] if row else create_job(name)
+        try:
+            job = run_job(job_id, **options)
+        except Exception:
+            logger.exception("Job #%s (%s) failed", job_id, name)
+            job = get_job(job_id)
+        if job is not None:
+            finished.append(job)
+    conn.close()
+    return finished
+
+def _print_job(job):
+    print(f"#{job['id']:<5} {job['name']:<28} {job['status']:<10} processed={job['processed']:<6} "
+          f"checkpoint={job['checkpoint']:<6} updated={job['updated_at']}"
+          + (f" error={job['error']}" if job['error'] else ""))
+
+def main(argv=None):
+    """
+    Command line interface for triggering and inspecting jobs.
+    """
+    parser = argparse.ArgumentParser(description="Run and inspect DepressAI background jobs.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_options = argparse.ArgumentParser(add_help=False)
+    run_options.add_argument('--chunk-size', type=int, default=100)
+    run_options.add_argument('--writes-per-second', type=float, default=200)
+    run_options.add_argument('--workers', type=int, default=None)
+
+    run_parser = subparsers.add_parser('run', parents=[run_options], help="Start a new run of a job.")
+    run_parser.add_argument('name', choices=list(JOBS))
+    resume_parser = subparsers.add_parser('resume', parents=[run_options], help="Resume an unfinished job run.")
+    resume_parser.add_argument('job_id', type=int)
+    subparsers.add_parser('nightly', parents=[run_options], help="Run every registered job.")
+    list_parser = subparsers.add_parser('list', help="Show registered jobs and recent runs.")
+    list_parser.add_argument('--limit', type=int, default=20)
+    status_parser = subparsers.add_parser('status', help="Show a single job run.")
+    status_parser.add_argument('job_id', type=int)
+
+    args = parser.parse_args(argv)
+    init_db()
+
+    if args.command == 'list':
+        print("Registered jobs: " + ", ".join(JOBS))
+        for job in list_jobs(args.limit):
+            _print_job(job)
+        return 0
+    if args.command == 'status':
+        job = get_job(args.job_id)
+        if job is None:
+            print(f"No job with id {args.job_id}")
+            return 1
+        _print_job(job)
+        return 0
+
+    options = {'chunk_size': args.chunk_size, 'writes_per_second': args.writes_per_second, 'workers': args.workers}
+    try:
+        if args.command == 'run':
+            _print_job(run_job(create_job(args.name), **options))
+        elif args.command == 'resume':
+            job = run_job(args.job_id, **options)
+            if job is None:
+                print(f"Job #{args.job_id} is being run by another process")
+                return 1
+            _print_job(job)
+        else:
+            jobs = run_nightly(**options)
+            for job in jobs:
+                _print_job(job)
+            failed = [job for job in jobs if job['status'] == 'failed']
+            if failed:
+                print(f"{len(failed)} job(s) failed: " + ", ".join(job['name'] for job in failed))
+                return 1
+    except Exception as e:
+        print(f"Job failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
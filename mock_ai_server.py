@@ -0,0 +1,250 @@
+"""
+Local mock of an OpenAI-compatible chat completions API, for exercising /chat without the network.
+
+Serves POST /v1/chat/completions with a deterministic reply, optionally streamed as server-sent
+events, after a configurable latency, and can inject errors at a given rate.
+
+Usage:
+    python mock_ai_server.py --port 8001 --latency lognormal --latency-ms 400 --jitter-ms 150 --error-rate 0.02
+    AI_API_URL=http://127.0.0.1:8001/v1/chat/completions python project.py
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+class LatencyModel:
+    """
+    Samples response latencies from a fixed, uniform, normal or lognormal distribution.
+    """
+    def __init__(self, distribution="fixed", mean_ms=0.0, jitter_ms=0.0, seed=None):
+        """
+        Parameters:
+            distribution (str): One of LATENCY_DISTRIBUTIONS.
+            mean_ms (float): The mean latency in milliseconds.
+            jitter_ms (float): The spread: half-width for uniform, standard deviation for normal and lognormal.
+            seed (int): (Optional) Seed for reproducible latencies and error injection.
+        """
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """
+        Returns a latency in seconds.
+        """
+        with self._lock:
+            if self.distribution == "fixed" or not self.jitter_ms:
+                latency_ms = self.mean_ms
+            elif self.distribution == "uniform":
+                latency_ms = self.random.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms)
+            elif self.distribution == "normal":
+                latency_ms = self.random.gauss(self.mean_ms, self.jitter_ms)
+            elif self.mean_ms > 0:
+                # Parameterize the underlying normal so the lognormal has the requested mean and deviation.
+                sigma_squared = math.log(1 + (self.jitter_ms / self.mean_ms) ** 2)
+                mu = math.log(self.mean_ms) - sigma_squared / 2
+                latency_ms = self.random.lognormvariate(mu, math.sqrt(sigma_squared))
+            else:
+                latency_ms = 0.0
+        return max(0.0, latency_ms) / 1000.0
+
+    def roll(self, rate):
+        """
+        Returns True with the given probability.
+        """
+        with self._lock:
+            return self.random.random() < rate
+
+def mock_reply(messages):
+    """
+    Returns the deterministic reply the mock gives to a conversation.
+    """
+    last = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    return f"Thank you for sharing that with me. You said: {last}"
+
+class MockCompletionsHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for the mock server. Options are read from the server instance.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/api/v1/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            payload = json.loads(raw or b"{}")
+            messages = payload["messages"]
+        except (ValueError, KeyError):
+            self._send_json(400, {"error": {"message": "Request body must be JSON with a 'messages' list"}})
+            return
+
+        server = self.server
+        time.sleep(server.latency.sample())
+
+        if server.error_rate and server.latency.roll(server.error_rate):
+            headers = {"Retry-After": "1"} if server.error_status == 429 else None
+            self._send_json(server.error_status,
+                            {"error": {"message": "Injected error", "code": server.error_status}}, headers)
+            return
+
+        server.count_request()
+        model = payload.get("model", "mock-model")
+        content = mock_reply(messages)
+        completion_id = f"chatcmpl-mock-{server.requests_served}"
+        created = int(time.time())
+
+        if payload.get("stream"):
+            self._stream(completion_id, created, model, content)
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        completion_tokens = len(content.split())
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    def _stream(self, completion_id, created, model, content):
+        """
+        Sends the reply word by word as OpenAI-style server-sent events.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        event({"role": "assistant"})
+        for i, word in enumerate(content.split(" ")):
+            time.sleep(self.server.token_delay)
+            event({"content": word if i == 0 else " " + word})
+        event({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+class MockCompletionsServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the mock's latency, error and streaming options.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=None, error_rate=0.0, error_status=500, token_delay=0.0, quiet=False):
+        """
+        Parameters:
+            address (tuple): The (host, port) to listen on; port 0 picks a free port.
+            latency (LatencyModel): (Optional) The response latency model. Defaults to no delay.
+            error_rate (float): The fraction of requests answered with error_status.
+            error_status (int): The HTTP status used for injected errors.
+            token_delay (float): Seconds between streamed chunks.
+            quiet (bool): Whether to suppress the per-request log lines.
+        """
+        super().__init__(address, MockCompletionsHandler)
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_delay = token_delay
+        self.quiet = quiet
+        self.requests_served = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def url(self):
+        """
+        The chat completions URL to use as AI_API_URL.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests_served += 1
+
+def main(argv=None):
+    """
+    Command line entry point for running the mock server.
+    """
+    parser = argparse.ArgumentParser(description="Run a local mock of the chat completions API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', choices=LATENCY_DISTRIBUTIONS, default='fixed',
+                        help="Latency distribution (default: fixed).")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Mean latency in milliseconds.")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Latency spread in milliseconds.")
+    parser.add_argument('--token-ms', type=float, default=0.0, help="Delay between streamed chunks in milliseconds.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail.")
+    parser.add_argument('--error-status', type=int, default=500, help="HTTP status for injected failures.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible latencies and errors.")
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    server = MockCompletionsServer(
+        (args.host, args.port),
+        latency=LatencyModel(args.latency, args.latency_ms, args.jitter_ms, args.seed),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        token_delay=args.token_ms / 1000.0,
+        quiet=args.quiet
+    )
+    print(f"Mock chat completions API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+"""
+Token-bucket rate limiting and daily quotas for expensive routes such as /chat.
+
+Two storage backends are provided:
+    - MemoryBackend: per-process state; fine for a single worker or for tests.
+    - SQLiteBackend: state shared through the database file, so every worker process
+      of a multi-worker deployment sees the same buckets and quotas.
+"""
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+# Seconds between sweeps that drop buckets which have refilled to capacity. A full bucket behaves
+# exactly like a missing one, so removing it only frees memory; without the sweep every client IP
+# ever seen would keep an entry forever.
+SWEEP_INTERVAL = 60
+
+def _day(now):
+    """
+    Returns the UTC calendar day for the given epoch seconds, used as the quota period.
+    """
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+def _seconds_until_next_day(now):
+    return 86400 - int(now) % 86400
+
+def _refill(tokens, updated_at, now, capacity, refill_rate):
+    """
+    Returns the bucket's token count after refilling it for the time elapsed since updated_at.
+    """
+    return min(capacity, tokens + max(0.0, now - updated_at) * refill_rate)
+
+def _take_token(tokens, refill_rate):
+    """
+    Attempts to take one token from a refilled bucket.
+
+    Returns:
+        tuple: (allowed, remaining tokens, seconds until a token is available)
+    """
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / refill_rate
+
+def _full_since(now, capacity, refill_rate):
+    """
+    Returns the time before which a bucket last updated is certain to have refilled to capacity.
+    """
+    return now - capacity / refill_rate
+
+def _evaluate(buckets, capacity, refill_rate, quota_used, quota_limit, now):
+    """
+    Decides a request against refilled bucket states and the quota count, without changing them.
+
+    Parameters:
+        buckets (dict): reason -> (tokens, updated_at) as stored, or None for a new bucket.
+        quota_used (int): The calls already counted against today's quota.
+
+    Returns:
+        tuple: (reason, retry_after, refilled) where reason is None if every check allows the
+               request and refilled maps each reason to its refilled token count.
+    """
+    refilled = {}
+    for reason, state in buckets.items():
+        tokens, updated_at = state if state else (capacity, now)
+        refilled[reason] = _refill(tokens, updated_at, now, capacity, refill_rate)
+        allowed, _, retry_after = _take_token(refilled[reason], refill_rate)
+        if not allowed:
+            return reason, retry_after, refilled
+    if quota_used >= quota_limit:
+        return 'quota', _seconds_until_next_day(now), refilled
+    return None, 0.0, refilled
+
+class MemoryBackend:
+    """
+    Keeps buckets and quota counters in this process's memory.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._quota_day = None
+        self._quota_counts = {}
+        self._next_sweep = 0.0
+
+    def acquire(self, bucket_keys, capacity, refill_rate, quota_key, quota_limit, now):
+        """
+        Admits a request only if every bucket has a token and the quota has room, and only then
+        takes a token from each bucket and counts the call against the quota.
+
+        Parameters:
+            bucket_keys (dict): reason -> bucket key, e.g. {'user': 'user:5', 'ip': 'ip:10.0.0.1'}.
+            capacity (int): The bucket capacity.
+            refill_rate (float): Tokens added per second.
+            quota_key (str): The key the daily quota is counted under.
+            quota_limit (int): The maximum number of calls per UTC day.
+            now (float): The current time in epoch seconds.
+
+        Returns:
+            tuple: (reason, retry_after) where reason is None if the request was admitted,
+                   otherwise the reason of the first check that rejected it.
+        """
+        with self._lock:
+            day = _day(now)
+            if day != self._quota_day:
+                self._quota_day = day
+                self._quota_counts = {}
+            if now >= self._next_sweep:
+                full_since = _full_since(now, capacity, refill_rate)
+                self._buckets = {key: state for key, state in self._buckets.items() if state[1] >= full_since}
+                self._next_sweep = now + SWEEP_INTERVAL
+            states = {reason: self._buckets.get(key) for reason, key in bucket_keys.items()}
+            used = self._quota_counts.get(quota_key, 0)
+            reason, retry_after, refilled = _evaluate(states, capacity, refill_rate, used, quota_limit, now)
+            if reason is None:
+                for bucket_reason, key in bucket_keys.items():
+                    self._buckets[key] = (refilled[bucket_reason] - 1, now)
+                self._quota_counts[quota_key] = used + 1
+        return reason, retry_after
+
+class SQLiteBackend:
+    """
+    Keeps buckets and quota counters in SQLite so they are shared by every worker process.
+
+    Each check runs in a BEGIN IMMEDIATE transaction, which serializes concurrent updates to the same bucket.
+    If the database stays locked for longer than timeout, acquire raises sqlite3.OperationalError.
+    """
+    def __init__(self, path='database.db', timeout=5):
+        """
+        Parameters:
+            path (str): The SQLite database file to store the limiter tables in.
+            timeout (float): Seconds to wait for the database lock before giving up.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._next_sweep = 0.0
+        with self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS rate_limit_quotas (
+                    key TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (key, day)
+                );
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def acquire(self, bucket_keys, capacity, refill_rate, quota_key, quota_limit, now):
+        """
+        Admits a request only if every bucket has a token and the quota has room, and only then
+        takes a token from each bucket and counts the call against the quota.
+
+        See MemoryBackend.acquire for the parameters and return value.
+        """
+        day = _day(now)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            states = {}
+            for reason, key in bucket_keys.items():
+                states[reason] = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+            row = conn.execute(
+                "SELECT calls FROM rate_limit_quotas WHERE key = ? AND day = ?", (quota_key, day)
+            ).fetchone()
+            used = row[0] if row else 0
+            reason, retry_after, refilled = _evaluate(states, capacity, refill_rate, used, quota_limit, now)
+            if reason is None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(key, refilled[bucket_reason] - 1, now) for bucket_reason, key in bucket_keys.items()]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_quotas (key, day, calls) VALUES (?, ?, ?)",
+                    (quota_key, day, used + 1)
+                )
+            if now >= self._next_sweep:
+                conn.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?",
+                             (_full_since(now, capacity, refill_rate),))
+                # Counters from previous days are no longer needed.
+                conn.execute("DELETE FROM rate_limit_quotas WHERE day < ?", (day,))
+                self._next_sweep = now + SWEEP_INTERVAL
+            conn.execute("COMMIT")
+        except Exception:
+            # BEGIN IMMEDIATE itself fails when the lock times out; there is nothing to roll back then.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return reason, retry_after
+
+class RateLimiter:
+    """
+    Admits or rejects requests using per-user and per-IP token buckets and a daily per-user quota.
+
+    A request only uses up tokens and quota when every check admits it, so rejected retries do
+    not drain the other buckets (e.g. a user over quota cannot exhaust the bucket of a shared IP).
+
+    The limiter also counts its decisions ('admitted', 'rejected_user', 'rejected_ip', 'rejected_quota')
+    so the admission rate can be monitored. Counts are per process.
+    """
+    def __init__(self, backend, requests_per_minute=10, burst=5, daily_quota=200, clock=time.time):
+        """
+        Parameters:
+            backend: A MemoryBackend or SQLiteBackend instance.
+            requests_per_minute (float): The sustained rate allowed per user and per IP.
+            burst (int): The bucket capacity, i.e. how many requests may arrive back to back.
+            daily_quota (int): The maximum number of admitted requests per user per UTC day.
+            clock (callable): (Optional) Returns the current time in epoch seconds.
+        """
+        self.backend = backend
+        self.capacity = burst
+        self.refill_rate = requests_per_minute / 60.0
+        self.daily_quota = daily_quota
+        self.clock = clock
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def check(self, user_id, ip):
+        """
+        Decides whether a request from user_id at ip may proceed, consuming a token and a quota unit if so.
+
+        Returns:
+            tuple: (allowed, retry_after, reason) where retry_after is a whole number of seconds
+                   and reason is None when allowed, otherwise 'user', 'ip' or 'quota'.
+        """
+        reason, retry_after = self.backend.acquire(
+            {'user': f"user:{user_id}", 'ip': f"ip:{ip}"},
+            self.capacity,
+            self.refill_rate,
+            f"user:{user_id}",
+            self.daily_quota,
+            self.clock()
+        )
+        if reason is not None:
+            self._record(f"rejected_{reason}")
+            return False, max(1, math.ceil(retry_after)), reason
+        self._record('admitted')
+        return True, 0, None
+
+    def _record(self, outcome):
+        with self._stats_lock:
+            self.stats[outcome] += 1
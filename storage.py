@@ -0,0 +1,227 @@
+"""
+Routing of per-user tables to SQLite database files.
+
+By default everything lives in database.db. Setting the DB_SHARDS environment variable to N
+splits the per-user tables (USER_DATA_TABLES) across N files, database.shard0.db through
+database.shard{N-1}.db, chosen by a hash of the user id. Each shard has its own writer lock, so
+writes for users on different shards no longer wait on each other. The users table and the other
+shared tables (jobs, rate limits) always stay in the directory database, database.db.
+
+Usage:
+    python storage.py rebalance --from 0 --to 4
+    python storage.py benchmark --shards 1 2 4 8 --writers 8 --rows 500
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+from multiprocessing import Pool
+
+# Holds users and the other tables shared by all users.
+DIRECTORY_DB = 'database.db'
+
+# Tables whose rows belong to a single user and are routed by user_id.
+USER_DATA_TABLES = ("moods", "chat_history", "wellness_plans", "mood_aggregates")
+
+# Number of shard files; 0 keeps the per-user tables in the directory database.
+SHARD_COUNT = int(os.environ.get('DB_SHARDS', 0))
+
+def shard_path(index):
+    """
+    Returns the file name of the shard with the given index.
+    """
+    return f"database.shard{index}.db"
+
+def user_db_paths(shards=None):
+    """
+    Returns every database file holding per-user tables.
+
+    Parameters:
+        shards (int): (Optional) The shard count to route for. Defaults to SHARD_COUNT.
+    """
+    shards = SHARD_COUNT if shards is None else shards
+    if not shards:
+        return [DIRECTORY_DB]
+    return [shard_path(index) for index in range(shards)]
+
+def user_db_path(user_id, shards=None):
+    """
+    Returns the database file holding the given user's rows.
+
+    Parameters:
+        user_id (int): The ID of the user.
+        shards (int): (Optional) The shard count to route for. Defaults to SHARD_COUNT.
+    """
+    shards = SHARD_COUNT if shards is None else shards
+    if not shards:
+        return DIRECTORY_DB
+    return shard_path(zlib.crc32(str(user_id).encode()) % shards)
+
+def connect_user(user_id):
+    """
+    Returns a new connection to the database file holding the given user's rows.
+    """
+    return sqlite3.connect(user_db_path(user_id))
+
+def group_by_path(user_ids, shards=None):
+    """
+    Groups user ids by the database file holding their rows.
+
+    Returns:
+        dict: A mapping of database file to the list of user ids stored in it.
+    """
+    groups = {}
+    for user_id in user_ids:
+        groups.setdefault(user_db_path(user_id, shards), []).append(user_id)
+    return groups
+
+def _columns(conn, table):
+    """
+    Returns the table's column names, excluding the id primary key.
+    """
+    return [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})") if row[1] != 'id']
+
+def rebalance(old_shards, new_shards):
+    """
+    Moves per-user rows from the layout for old_shards to the layout for new_shards.
+
+    The target database is attached to the source connection and each user's rows are copied and
+    deleted in a single transaction, so an interrupted rebalance never loses or duplicates a user's
+    rows and can simply be run again. Moved rows get new ids in the target file; their relative
+    order is preserved. The application should be stopped while rebalancing, and every target file
+    must already have the per-user schema (see project.init_user_db).
+
+    Parameters:
+        old_shards (int): The shard count the data is currently laid out for (0 for unsharded).
+        new_shards (int): The shard count to lay the data out for (0 for unsharded).
+
+    Returns:
+        int: The number of users whose rows were moved.
+    """
+    moved = 0
+    union = " UNION ".join(f"SELECT user_id FROM {table}" for table in USER_DATA_TABLES)
+    for source in user_db_paths(old_shards):
+        if not os.path.exists(source):
+            continue
+        conn = sqlite3.connect(source, isolation_level=None)
+        try:
+            user_ids = [row[0] for row in conn.execute(f"SELECT user_id FROM ({union}) ORDER BY user_id")]
+            targets = group_by_path(user_ids, new_shards)
+            targets.pop(source, None)
+            columns = {table: ", ".join(_columns(conn, table)) for table in USER_DATA_TABLES}
+            for target, target_user_ids in targets.items():
+                conn.execute("ATTACH DATABASE ? AS target", (target,))
+                try:
+                    conn.execute("INSERT OR IGNORE INTO target.mood_types SELECT * FROM main.mood_types")
+                    for user_id in target_user_ids:
+                        conn.execute("BEGIN IMMEDIATE")
+                        try:
+                            for table in USER_DATA_TABLES:
+                                conn.execute(
+                                    f'''INSERT INTO target.{table} ({columns[table]})
+                                        SELECT {columns[table]} FROM main.{table} WHERE user_id = ? ORDER BY id''',
+                                    (user_id,)
+                                )
+                                conn.execute(f"DELETE FROM main.{table} WHERE user_id = ?", (user_id,))
+                            conn.execute("COMMIT")
+                        except Exception:
+                            conn.execute("ROLLBACK")
+                            raise
+                        moved += 1
+                finally:
+                    conn.execute("DETACH DATABASE target")
+        finally:
+            conn.close()
+    return moved
+
+def _benchmark_writer(task):
+    """
+    Benchmark worker: inserts rows for its users, one connection and commit per row like a request would.
+    """
+    shards, user_ids, rows = task
+    for i in range(rows):
+        user_id = user_ids[i % len(user_ids)]
+        conn = sqlite3.connect(user_db_path(user_id, shards), timeout=60)
+        with conn:
+            conn.execute(
+                "INSERT INTO chat_history (user_id, user_message, ai_response) VALUES (?, ?, ?)",
+                (user_id, "benchmark message", "benchmark response")
+            )
+        conn.close()
+    return rows
+
+def benchmark(shard_counts, writers, rows, users_per_writer=64):
+    """
+    Measures chat_history insert throughput for each shard count, using one process per writer.
+
+    Runs in a temporary directory so the real databases are not touched.
+
+    Parameters:
+        shard_counts (list): The shard counts to compare.
+        writers (int): The number of concurrent writer processes.
+        rows (int): The number of rows each writer inserts.
+        users_per_writer (int): The number of distinct users each writer writes for.
+
+    Returns:
+        dict: A mapping of shard count to rows written per second.
+    """
+    from project import init_user_db
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for shards in shard_counts:
+                for path in user_db_paths(shards):
+                    init_user_db(path)
+                tasks = [(shards, list(range(writer + 1, writers * users_per_writer + 1, writers)), rows)
+                         for writer in range(writers)]
+                with Pool(writers) as pool:
+                    start = time.perf_counter()
+                    written = sum(pool.map(_benchmark_writer, tasks))
+                    results[shards] = written / (time.perf_counter() - start)
+                for path in user_db_paths(shards):
+                    os.remove(path)
+        finally:
+            os.chdir(cwd)
+    return results
+
+def main(argv=None):
+    """
+    Command line interface for rebalancing shards and benchmarking write throughput.
+    """
+    parser = argparse.ArgumentParser(description="Manage DepressAI's sharded SQLite storage.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebalance_parser = subparsers.add_parser('rebalance', help="Move per-user rows to a new shard count.")
+    rebalance_parser.add_argument('--from', dest='old_shards', type=int, required=True,
+                                  help="Current shard count (0 for a single database.db).")
+    rebalance_parser.add_argument('--to', dest='new_shards', type=int, required=True,
+                                  help="New shard count (0 for a single database.db).")
+
+    benchmark_parser = subparsers.add_parser('benchmark', help="Compare write throughput across shard counts.")
+    benchmark_parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    benchmark_parser.add_argument('--writers', type=int, default=os.cpu_count())
+    benchmark_parser.add_argument('--rows', type=int, default=500)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebalance':
+        from project import init_user_db
+        for path in set(user_db_paths(args.old_shards) + user_db_paths(args.new_shards)):
+            init_user_db(path)
+        moved = rebalance(args.old_shards, args.new_shards)
+        print(f"Moved {moved} users from {args.old_shards} to {args.new_shards} shards.")
+        print(f"Start the application with DB_SHARDS={args.new_shards}.")
+    else:
+        print(f"{args.writers} writer processes, {args.rows} rows each")
+        for shards, throughput in benchmark(args.shards, args.writers, args.rows).items():
+            print(f"{shards:>3} shard(s): {throughput:10.1f} rows/s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
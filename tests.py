@@ -3,6 +3,7 @@ import random
 import sqlite3
 import pytest
 import json
+from datetime import datetime
 from project import app, init_db  # Adjust the import if your file name is different
 
 # Fixture to set up a test client and initialize a fresh database for testing.
@@ -116,3 +117,471 @@ def test_chat_route_authenticated(client):
     assert 'response' in data
     # You might check that the AI response is a string.
     assert isinstance(data['response'], str)
+
+def test_purge_orphaned_rows_job(client):
+    from jobs import create_job, run_job
+
+    register(client, 'testuser5', 'testpass')
+    login(client, 'testuser5', 'testpass')
+    client.post('/moodtracker', data={'mood': 'Calm', 'intensity': '3', 'description': ''})
+
+    # Delete the account row directly, leaving its mood entries behind.
+    with sqlite3.connect('database.db') as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'testuser5'").fetchone()[0]
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.commit()
+
+    job = run_job(create_job('purge_orphaned_rows'), writes_per_second=0)
+    assert job['status'] == 'completed'
+    with sqlite3.connect('database.db') as conn:
+        remaining = conn.execute("SELECT COUNT(*) FROM moods WHERE user_id = ?", (user_id,)).fetchone()[0]
+    assert remaining == 0
+
+def test_regenerate_wellness_plans_job_checkpoints(client):
+    from jobs import create_job, run_job
+
+    register(client, 'testuser6', 'testpass')
+    login(client, 'testuser6', 'testpass')
+    client.post('/moodtracker', data={'mood': 'Tired', 'intensity': '6', 'description': ''})
+
+    job = run_job(create_job('regenerate_wellness_plans'), chunk_size=1, writes_per_second=0, workers=2)
+    with sqlite3.connect('database.db') as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'testuser6'").fetchone()[0]
+        last_user_id = conn.execute("SELECT MAX(id) FROM users").fetchone()[0]
+        plans = conn.execute("SELECT plan_text FROM wellness_plans WHERE user_id = ?", (user_id,)).fetchall()
+    assert job['status'] == 'completed'
+    assert job['checkpoint'] == last_user_id
+    assert len(plans) == 1
+    assert plans[0][0].startswith('Your Personalized 7-Day Wellness Plan:')
+
+def test_moodtracker_rejects_invalid_entries(client):
+    register(client, 'testuser7', 'testpass')
+    login(client, 'testuser7', 'testpass')
+
+    response = client.post('/moodtracker', data={'mood': 'Grumpy', 'intensity': '5'}, follow_redirects=True)
+    assert b'Unknown mood' in response.data
+    response = client.post('/moodtracker', data={'mood': 'Happy', 'intensity': '11'}, follow_redirects=True)
+    assert b'Intensity must be between 1 and 10.' in response.data
+    response = client.post('/moodtracker', data={'mood': 'Happy', 'intensity': 'high'}, follow_redirects=True)
+    assert b'Intensity must be a whole number.' in response.data
+
+def test_migrate_legacy_moods(tmp_path, monkeypatch):
+    # Build a database with the old free-text moods schema in an empty directory.
+    monkeypatch.chdir(tmp_path)
+    with sqlite3.connect('database.db') as conn:
+        conn.execute('''CREATE TABLE moods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, mood TEXT NOT NULL,
+            description TEXT, intensity INTEGER DEFAULT 5, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.executemany(
+            "INSERT INTO moods (user_id, mood, description, intensity, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(1, 'Happy', 'good day', '10', '2025-04-16 16:57:18'),
+             (1, 'Meh', '', 'x', '2025-04-17 09:00:00'),
+             (2, 'Sad', None, '42', '2025-04-18 12:30:00')]
+        )
+        conn.commit()
+
+    init_db()
+
+    with sqlite3.connect('database.db') as conn:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(moods)")]
+        rows = conn.execute(
+            '''SELECT moods.id, mood_types.name, intensity, created_at FROM moods
+               JOIN mood_types ON mood_types.id = moods.mood_id ORDER BY moods.id'''
+        ).fetchall()
+    assert 'mood' not in columns and 'mood_id' in columns
+    assert [row[1] for row in rows] == ['Happy', 'Meh', 'Sad']
+    assert [row[2] for row in rows] == [10, 5, 10]
+    assert all(isinstance(row[3], int) for row in rows)
+    assert rows[0][3] == int(datetime.strptime('2025-04-16 16:57:18', '%Y-%m-%d %H:%M:%S').timestamp())
+
+def test_rate_limiter_token_bucket_and_quota():
+    from ratelimit import RateLimiter, MemoryBackend
+
+    now = [1000.0]
+    limiter = RateLimiter(MemoryBackend(), requests_per_minute=60, burst=2, daily_quota=3, clock=lambda: now[0])
+
+    assert limiter.check(1, '10.0.0.1')[0]
+    assert limiter.check(1, '10.0.0.1')[0]
+    # The burst is used up; a token refills after one second.
+    assert limiter.check(1, '10.0.0.1') == (False, 1, 'user')
+    now[0] += 1
+    assert limiter.check(1, '10.0.0.1')[0]
+    # The daily quota of three calls is now exhausted.
+    now[0] += 10
+    allowed, retry_after, reason = limiter.check(1, '10.0.0.1')
+    assert not allowed and reason == 'quota' and retry_after > 1
+    assert limiter.stats['admitted'] == 3
+
+def test_sqlite_rate_limit_backend_is_shared(tmp_path):
+    from ratelimit import RateLimiter, SQLiteBackend
+
+    path = str(tmp_path / 'limits.db')
+    first = RateLimiter(SQLiteBackend(path), requests_per_minute=1, burst=1, daily_quota=10, clock=lambda: 1000.0)
+    second = RateLimiter(SQLiteBackend(path), requests_per_minute=1, burst=1, daily_quota=10, clock=lambda: 1000.0)
+
+    assert first.check(1, '10.0.0.1')[0]
+    # A second worker sharing the database sees the bucket the first worker drained.
+    assert second.check(1, '10.0.0.2') == (False, 60, 'user')
+    assert second.check(2, '10.0.0.1') == (False, 60, 'ip')
+
+def test_chat_route_rate_limited(client, monkeypatch):
+    import project
+    from ratelimit import RateLimiter, MemoryBackend
+
+    monkeypatch.setattr(project, 'chat_limiter', RateLimiter(MemoryBackend(), requests_per_minute=1, burst=1))
+    monkeypatch.setattr(project, 'get_ai_response', lambda prompt, conversation_context=None: 'Hi there')
+    register(client, 'testuser8', 'testpass')
+    login(client, 'testuser8', 'testpass')
+
+    assert client.post('/chat', json={'message': 'Hello'}).status_code == 200
+    response = client.post('/chat', json={'message': 'Hello again'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '60'
+    assert 'error' in json.loads(response.data)
+
+def test_chat_history_pagination_and_export(client):
+    register(client, 'testuser9', 'testpass')
+    login(client, 'testuser9', 'testpass')
+    with sqlite3.connect('database.db') as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'testuser9'").fetchone()[0]
+        # Several rows share a created_at so the keyset must break ties on id.
+        conn.executemany(
+            "INSERT INTO chat_history (user_id, user_message, ai_response, created_at) VALUES (?, ?, ?, ?)",
+            [(user_id, f'message {i}', f'reply {i}', f'2025-04-{10 + i // 2:02d} 12:00:00') for i in range(5)]
+        )
+        conn.commit()
+
+    seen = []
+    params = {'limit': 2}
+    while True:
+        page = json.loads(client.get('/chat/history', query_string=params).data)
+        seen.extend(entry['user_message'] for entry in page['messages'])
+        if page['next_cursor'] is None:
+            break
+        params = dict(page['next_cursor'], limit=2)
+    assert seen == [f'message {i}' for i in reversed(range(5))]
+
+    exported = json.loads(client.get('/chat/export?format=json').data)
+    assert [entry['user_message'] for entry in exported] == [f'message {i}' for i in range(5)]
+    transcript = client.get('/chat/export?format=text').data
+    assert b'You: message 0\nAI Therapist: reply 0' in transcript
+
+def test_sharded_storage_and_rebalance(tmp_path, monkeypatch):
+    import storage
+    from jobs import run_nightly
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage, 'SHARD_COUNT', 3)
+    init_db()
+
+    with app.test_client() as client:
+        user_ids = []
+        for i in range(6):
+            register(client, f'sharduser{i}', 'testpass')
+            login(client, f'sharduser{i}', 'testpass')
+            client.post('/moodtracker', data={'mood': 'Calm', 'intensity': '4', 'description': ''})
+            response = client.get('/moodtracker')
+            assert b'Calm' in response.data
+            client.get('/logout')
+        with sqlite3.connect('database.db') as conn:
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+            # Per-user tables only exist in the shard files.
+            assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'moods'").fetchone() is None
+
+    for user_id in user_ids:
+        with sqlite3.connect(storage.user_db_path(user_id)) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM moods WHERE user_id = ?", (user_id,)).fetchone()[0] == 1
+    assert len({storage.user_db_path(user_id) for user_id in user_ids}) > 1
+
+    # Jobs read and write the shards the rows live in.
+    assert all(job['status'] == 'completed' for job in run_nightly(writes_per_second=0, workers=1))
+    with sqlite3.connect(storage.user_db_path(user_ids[0])) as conn:
+        assert conn.execute("SELECT entries FROM mood_aggregates WHERE user_id = ?", (user_ids[0],)).fetchone()[0] == 1
+
+    # Collapse the shards back into database.db.
+    from project import init_user_db
+    init_user_db('database.db')
+    assert storage.rebalance(3, 0) == len(user_ids)
+    monkeypatch.setattr(storage, 'SHARD_COUNT', 0)
+    with sqlite3.connect('database.db') as conn:
+        assert conn.execute("SELECT COUNT(DISTINCT user_id) FROM moods").fetchone()[0] == len(user_ids)
+    for path in storage.user_db_paths(3):
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM moods").fetchone()[0] == 0
+
+@pytest.fixture
+def mock_ai_server():
+    import threading
+    from mock_ai_server import MockCompletionsServer
+
+    server = MockCompletionsServer(('127.0.0.1', 0), quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_chat_route_with_mock_provider(client, mock_ai_server, monkeypatch):
+    import project
+    from ai_provider import AIProvider
+
+    monkeypatch.setattr(project, 'ai_provider', AIProvider(url=mock_ai_server.url, model='mock', api_key='test'))
+    register(client, 'testuser10', 'testpass')
+    login(client, 'testuser10', 'testpass')
+
+    data = json.loads(client.post('/chat', json={'message': 'I feel tired'}).data)
+    assert data['response'] == 'Thank you for sharing that with me. You said: I feel tired'
+    assert mock_ai_server.requests_served == 1
+
+def test_ai_provider_record_and_replay(tmp_path, mock_ai_server):
+    from ai_provider import AIProvider, Cassette
+
+    cassette = str(tmp_path / 'cassette.jsonl')
+    messages = [{'role': 'user', 'content': 'Hello'}]
+    recorder = AIProvider(url=mock_ai_server.url, model='mock', mode='record', cassette=Cassette(cassette))
+    recorded = recorder.complete(messages)
+
+    # Replay never touches the network, so it works against an unreachable URL.
+    player = AIProvider(url='http://127.0.0.1:9/unreachable', model='mock', mode='replay', cassette=Cassette(cassette))
+    assert player.complete(messages) == recorded
+    with pytest.raises(Exception, match='No recorded response'):
+        player.complete([{'role': 'user', 'content': 'Something new'}])
+
+def test_mock_ai_server_streaming_and_errors(mock_ai_server):
+    import requests
+    from ai_provider import AIProvider
+
+    payload = {'model': 'mock', 'messages': [{'role': 'user', 'content': 'Hi'}], 'stream': True}
+    response = requests.post(mock_ai_server.url, json=payload, stream=True, timeout=5)
+    events = [line[len(b'data: '):] for line in response.iter_lines() if line.startswith(b'data: ')]
+    assert events[-1] == b'[DONE]'
+    text = ''.join(json.loads(event)['choices'][0]['delta'].get('content', '') for event in events[:-1])
+    assert text == 'Thank you for sharing that with me. You said: Hi'
+
+    mock_ai_server.error_rate = 1.0
+    mock_ai_server.error_status = 503
+    with pytest.raises(Exception, match='status 503'):
+        AIProvider(url=mock_ai_server.url, model='mock').complete(payload['messages'])
+
+def test_run_job_skips_job_leased_by_another_process(client):
+    import time
+    from jobs import LEASE_SECONDS, create_job, get_job, run_job
+
+    job_id = create_job('reindex')
+    with sqlite3.connect('database.db') as conn:
+        conn.execute("UPDATE jobs SET status = 'running', owner = 'other', heartbeat = ? WHERE id = ?",
+                     (time.time(), job_id))
+        conn.commit()
+    assert run_job(job_id, writes_per_second=0) is None
+    assert get_job(job_id)['owner'] == 'other'
+
+    # Once the other process stops renewing its lease, the job can be taken over.
+    with sqlite3.connect('database.db') as conn:
+        conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time() - LEASE_SECONDS - 1, job_id))
+        conn.commit()
+    assert run_job(job_id, writes_per_second=0)['status'] == 'completed'
+
+def test_migrate_moods_finishes_interrupted_swap(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    init_db()
+    # Recreate the state left by a crash between DROP TABLE moods and the rename: the migrated
+    # rows are in moods_v2 and init_db has since created a fresh, empty moods table.
+    with sqlite3.connect('database.db') as conn:
+        conn.execute("INSERT INTO moods (user_id, mood_id, intensity, created_at) VALUES (1, 1, 7, 1744822638)")
+        conn.commit()
+        conn.execute("ALTER TABLE moods RENAME TO moods_v2")
+        conn.commit()
+
+    init_db()
+
+    with sqlite3.connect('database.db') as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        rows = conn.execute("SELECT user_id, mood_id, intensity FROM moods").fetchall()
+    assert 'moods_v2' not in tables
+    assert rows == [(1, 1, 7)]
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_rate_limiter_rejections_do_not_consume_other_buckets(tmp_path, backend):
+    from ratelimit import RateLimiter, MemoryBackend, SQLiteBackend
+
+    def limiter(**options):
+        store = MemoryBackend() if backend == 'memory' else SQLiteBackend(str(tmp_path / 'limits.db'))
+        return RateLimiter(store, requests_per_minute=60, clock=lambda: 1000.0, **options)
+
+    # A user over quota who keeps retrying must not drain the IP bucket they share with others.
+    shared = limiter(burst=2, daily_quota=1)
+    assert shared.check(1, '10.0.0.1')[0]
+    assert shared.check(1, '10.0.0.1')[2] == 'quota'
+    assert shared.check(1, '10.0.0.1')[2] == 'quota'
+    assert shared.check(2, '10.0.0.1')[0]
+
+    # A request rejected by the IP bucket must not cost the user a token.
+    per_ip = limiter(burst=1, daily_quota=10)
+    assert per_ip.check(3, '10.0.0.2')[0]
+    assert per_ip.check(4, '10.0.0.2')[2] == 'ip'
+    assert per_ip.check(4, '10.0.0.3')[0]
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_rate_limiter_expires_refilled_buckets(tmp_path, backend):
+    from ratelimit import SWEEP_INTERVAL, RateLimiter, MemoryBackend, SQLiteBackend
+
+    path = str(tmp_path / 'limits.db')
+    store = MemoryBackend() if backend == 'memory' else SQLiteBackend(path)
+    now = [1000.0]
+    limiter = RateLimiter(store, requests_per_minute=60, burst=5, clock=lambda: now[0])
+
+    def bucket_keys():
+        if backend == 'memory':
+            return set(store._buckets)
+        with sqlite3.connect(path) as conn:
+            return {row[0] for row in conn.execute("SELECT key FROM rate_limit_buckets")}
+
+    for i in range(3):
+        assert limiter.check(i, f'10.0.0.{i}')[0]
+    assert len(bucket_keys()) == 6
+    # Past the sweep interval every idle bucket has refilled (5 tokens at 1/s) and is dropped.
+    now[0] += SWEEP_INTERVAL + 1
+    assert limiter.check(9, '10.0.0.9')[0]
+    assert bucket_keys() == {'user:9', 'ip:10.0.0.9'}
+
+def test_chat_route_admits_when_limiter_database_is_locked(client, tmp_path, monkeypatch):
+    import project
+    from ratelimit import RateLimiter, SQLiteBackend
+
+    path = str(tmp_path / 'limits.db')
+    limiter = RateLimiter(SQLiteBackend(path, timeout=0.1))
+    monkeypatch.setattr(project, 'chat_limiter', limiter)
+    monkeypatch.setattr(project, 'get_ai_response', lambda prompt, conversation_context=None: 'Hi there')
+    register(client, 'testuser11', 'testpass')
+    login(client, 'testuser11', 'testpass')
+
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        # The lock timeout surfaces as-is rather than as a failed ROLLBACK.
+        with pytest.raises(sqlite3.OperationalError, match='database is locked'):
+            limiter.check(1, '10.0.0.1')
+        response = client.post('/chat', json={'message': 'Hello'})
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert response.status_code == 200
+    assert json.loads(response.data)['response'] == 'Hi there'
+
+def test_chat_export_does_not_block_writes(client):
+    from project import iter_chat_history
+
+    register(client, 'testuser12', 'testpass')
+    login(client, 'testuser12', 'testpass')
+    with sqlite3.connect('database.db') as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'testuser12'").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO chat_history (user_id, user_message, ai_response, created_at) VALUES (?, ?, ?, ?)",
+            [(user_id, f'message {i}', f'reply {i}', '2025-04-10 12:00:00') for i in range(5)]
+        )
+        conn.commit()
+
+    export = iter_chat_history(user_id, batch_size=2)
+    first = [next(export), next(export)]
+
+    # With the export half-read, another writer must still be able to commit promptly.
+    with sqlite3.connect('database.db', timeout=0.5) as conn:
+        conn.execute(
+            "INSERT INTO chat_history (user_id, user_message, ai_response, created_at) VALUES (?, ?, ?, ?)",
+            (user_id, 'message 5', 'reply 5', '2025-04-11 12:00:00')
+        )
+        conn.commit()
+
+    rest = list(export)
+    assert [entry['user_message'] for entry in first + rest] == [f'message {i}' for i in range(6)]
+
+def test_ai_provider_reads_api_key_only_from_environment(monkeypatch):
+    from ai_provider import AIProvider
+
+    monkeypatch.delenv('AI_API_KEY', raising=False)
+    provider = AIProvider.from_env()
+    assert provider.api_key is None
+    assert 'Authorization' not in provider._headers()
+
+    monkeypatch.setenv('AI_API_KEY', 'secret')
+    assert AIProvider.from_env()._headers()['Authorization'] == 'Bearer secret'
+
+def test_ai_provider_uses_one_session_per_thread():
+    import threading
+    from ai_provider import AIProvider
+
+    provider = AIProvider()
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(provider.session))
+    thread.start()
+    thread.join()
+    assert provider.session is provider.session
+    assert sessions[0] is not provider.session
+
+def test_init_db_upgrades_mood_aggregates_keyed_by_name(tmp_path, monkeypatch):
+    from jobs import create_job, run_job
+
+    monkeypatch.chdir(tmp_path)
+    with sqlite3.connect('database.db') as conn:
+        conn.execute('''CREATE TABLE mood_aggregates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, mood TEXT NOT NULL,
+            entries INTEGER NOT NULL, average_intensity REAL, last_entry_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute("INSERT INTO mood_aggregates (user_id, mood, entries) VALUES (1, 'Happy', 3)")
+        conn.commit()
+
+    init_db()
+    with sqlite3.connect('database.db') as conn:
+        conn.execute("INSERT INTO users (username, password) VALUES ('aggregates', 'x')")
+        conn.execute("INSERT INTO moods (user_id, mood_id, intensity) VALUES (1, 2, 4)")
+        conn.commit()
+
+    assert run_job(create_job('compute_mood_aggregates'), writes_per_second=0)['status'] == 'completed'
+    with sqlite3.connect('database.db') as conn:
+        rows = conn.execute("SELECT user_id, mood_id, entries FROM mood_aggregates").fetchall()
+    assert rows == [(1, 2, 1)]
+
+def test_run_nightly_continues_after_a_failing_job(tmp_path, monkeypatch):
+    import jobs
+
+    def failing_step(conn, user_ids, pool):
+        raise RuntimeError("boom")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(jobs.JOBS, 'purge_orphaned_rows', dict(jobs.JOBS['purge_orphaned_rows'], step=failing_step))
+    init_db()
+    with sqlite3.connect('database.db') as conn:
+        conn.execute("INSERT INTO moods (user_id, mood_id, intensity) VALUES (1, 1, 5)")
+        conn.commit()
+
+    statuses = {job['name']: job['status'] for job in jobs.run_nightly(writes_per_second=0)}
+    assert statuses.pop('purge_orphaned_rows') == 'failed'
+    assert set(statuses) == set(jobs.JOBS) - {'purge_orphaned_rows'}
+    assert all(status == 'completed' for status in statuses.values())
+
+    # The failed run is resumed (and fails again) the next night, and the CLI reports it.
+    assert jobs.main(['nightly']) == 1
+
+def test_wellness_serves_stored_plan(client):
+    from jobs import create_job, run_job
+
+    register(client, 'testuser8', 'testpass')
+    login(client, 'testuser8', 'testpass')
+    client.post('/moodtracker', data={'mood': 'Calm', 'intensity': '4', 'description': ''})
+    with sqlite3.connect('database.db') as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE username = 'testuser8'").fetchone()[0]
+        conn.execute("INSERT INTO wellness_plans (user_id, plan_text) VALUES (?, ?)", (user_id, 'Stored plan'))
+        conn.commit()
+
+    assert b'Stored plan' in client.get('/wellness').data
+    response = client.get('/wellness?regenerate=1')
+    assert b'Stored plan' not in response.data
+    assert b'Your Personalized 7-Day Wellness Plan:' in response.data
+
+    # Once the user's mood history is gone, the nightly job removes the stale plan.
+    with sqlite3.connect('database.db') as conn:
+        conn.execute("DELETE FROM moods WHERE user_id = ?", (user_id,))
+        conn.commit()
+    run_job(create_job('regenerate_wellness_plans'), writes_per_second=0, workers=1)
+    with sqlite3.connect('database.db') as conn:
+        assert conn.execute("SELECT COUNT(*) FROM wellness_plans WHERE user_id = ?", (user_id,)).fetchone()[0] == 0